@@ -1,15 +1,20 @@
 import os
 import json
 import logging
+import time
 import sqlite3
+import threading
 from datetime import datetime, date
-from logging.handlers import RotatingFileHandler
+from concurrent.futures import TimeoutError as FutureTimeout
 
+import click
 from flask import (
-    Flask, render_template, request,
-    redirect, flash, abort
+    Flask, Blueprint, current_app, render_template,
+    request, redirect, flash, abort, jsonify, g, session, has_request_context
 )
 
+from db_pool import ReadPool, Writer, ReplicaRefresher, PoolTimeout, ro_uri
+from group_commit import GroupCommitQueue
 from validators import (
     validate_name,
     validate_last_name,
@@ -18,45 +23,188 @@ from validators import (
     validate_diagnosis_text
 )
 
+# config.json ищем рядом с app.py, а не в текущем каталоге процесса
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG_PATH = os.path.join(BASE_DIR, "config.json")
+
+bp = Blueprint("clinic", __name__, cli_group=None)
+
 # ============================================================
 # КОНФИГУРАЦИЯ
 # ============================================================
-with open("config.json", encoding="utf-8") as f:
-    CONFIG = json.load(f)
+def load_config(path: str = DEFAULT_CONFIG_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
 
 # ============================================================
-# FLASK
+# ЛОГИРОВАНИЕ
 # ============================================================
-app = Flask(__name__)
-app.secret_key = "supersecret123"
-app.config["DATABASE"] = CONFIG["database"]
+def init_logging(app: Flask, log_cfg: dict):
+    # RotatingFileHandler тянет за собой logging.handlers — импортируем по месту
+    from logging.handlers import RotatingFileHandler
+
+    log_file = os.path.join(BASE_DIR, log_cfg["LOG_FILE"])
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+
+    log_level = getattr(logging, log_cfg.get("LEVEL", "INFO").upper(), logging.INFO)
+
+    handler = RotatingFileHandler(
+        log_file,
+        maxBytes=log_cfg["MAX_BYTES"],
+        backupCount=log_cfg["BACKUP_COUNT"],
+        encoding="utf-8"
+    )
+    handler.setLevel(log_level)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+
+    app.logger.setLevel(log_level)
+    app.logger.addHandler(handler)
 
 # ============================================================
-# ЛОГИРОВАНИЕ
+# FLASK
 # ============================================================
-os.makedirs("logs", exist_ok=True)
+def create_app(test_config: dict = None, config_path: str = DEFAULT_CONFIG_PATH) -> Flask:
+    """
+    Фабрика приложения. Конфиг, логирование и схема БД инициализируются
+    здесь, а не при импорте модуля. С test_config файл конфига не читается,
+    файловый лог и init_db не выполняются, а реплику можно включить через
+    READ_POOL.REPLICA_PATH.
+    """
+    app = Flask(__name__)
+    app.secret_key = "supersecret123"
+
+    if test_config is None:
+        config = load_config(config_path)
+        app.config["DATABASE"] = os.path.join(BASE_DIR, config["database"])
+        backup_cfg = dict(config.get("BACKUP", {}))
+        backup_cfg["DIR"] = os.path.join(BASE_DIR, backup_cfg.get("DIR", "backups"))
+        app.config["BACKUP"] = backup_cfg
+        app.config["READ_POOL"] = config.get("READ_POOL", {})
+        app.config["WRITER"] = config.get("WRITER", {})
+        app.config["WRITE_BEHIND"] = config.get("WRITE_BEHIND", {})
+        app.config["SERVER"] = {
+            "host": config["host"],
+            "port": config["port"],
+            "debug": config["debug"]
+        }
+        init_logging(app, config["LOGGING"])
+    else:
+        app.config.from_mapping(test_config)
 
-log_cfg = CONFIG["LOGGING"]
-log_level = getattr(logging, log_cfg.get("LEVEL", "INFO").upper(), logging.INFO)
+    app.register_blueprint(bp)
+    init_connections(app)
 
-handler = RotatingFileHandler(
-    log_cfg["LOG_FILE"],
-    maxBytes=log_cfg["MAX_BYTES"],
-    backupCount=log_cfg["BACKUP_COUNT"],
-    encoding="utf-8"
-)
-handler.setLevel(log_level)
-handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    if test_config is None:
+        with app.app_context():
+            init_db()
+        # соединение, открытое до fork воркеров, в них использовать нельзя:
+        # каждый процесс откроет своё при первой записи
+        app.extensions["db_writer"].close()
+    start_replica(app)
 
-app.logger.setLevel(log_level)
-app.logger.addHandler(handler)
+    return app
 
 # ============================================================
 # БАЗА ДАННЫХ
 # ============================================================
+# размер пачки для массовых удалений: каждая пачка — отдельная короткая
+# транзакция, чтобы не держать блокировку записи надолго
+DELETE_BATCH_SIZE = 500
+
+# сколько запрос ждёт фиксации отложенной записи
+WRITE_BEHIND_TIMEOUT = 30
+
+
+def init_connections(app: Flask):
+    """
+    Записи идут через одно соединение-писатель на процесс,
+    чтения GET-маршрутов — через пул соединений только для чтения.
+    """
+    pool_cfg = app.config.get("READ_POOL", {})
+    writer = Writer(
+        app.config["DATABASE"],
+        acquire_timeout=app.config.get("WRITER", {}).get("ACQUIRE_TIMEOUT", 10)
+    )
+    app.extensions["db_writer"] = writer
+    read_pool = ReadPool(
+        app.config["DATABASE"],
+        size=pool_cfg.get("SIZE", 4),
+        acquire_timeout=pool_cfg.get("ACQUIRE_TIMEOUT", 30)
+    )
+    app.extensions["db_read_pool"] = read_pool
+
+    # WRITE_BEHIND.ENABLED = false — назначения диагнозов пишутся синхронно
+    wb_cfg = app.config.get("WRITE_BEHIND", {})
+    if wb_cfg.get("ENABLED"):
+        app.extensions["write_queue"] = GroupCommitQueue(
+            writer,
+            max_batch=wb_cfg.get("MAX_BATCH", 100),
+            max_delay_ms=wb_cfg.get("MAX_DELAY_MS", 5)
+        )
+
+    @app.teardown_appcontext
+    def release_connections(exc):
+        # страховка на случай исключения между get_*db() и close()
+        writer.release_if_held()
+        for pool, conn, lease in g.pop("read_leases", []):
+            pool.release(conn, lease)
+
+
+def start_replica(app: Flask):
+    """
+    Если задан READ_POOL.REPLICA_PATH, чтения идут из локальной копии базы,
+    которая обновляется раз в REPLICA_REFRESH_SECONDS секунд. Поток обновления
+    запускается при первом чтении в процессе, до первой копии чтения идут
+    из основной базы.
+
+    Реплика отстаёт от записи, поэтому сессия, которая недавно писала
+    (2 * REPLICA_REFRESH_SECONDS), читает из основной базы: после POST
+    с редиректом пользователь видит свою запись. Чужие изменения другие
+    сессии видят с задержкой до одного обновления реплики.
+    """
+    pool_cfg = app.config.get("READ_POOL", {})
+    if not pool_cfg.get("REPLICA_PATH"):
+        return
+
+    # отдельный пул: основной пул чтения всегда смотрит в основную базу
+    replica_pool = ReadPool(
+        app.config["DATABASE"],
+        size=pool_cfg.get("SIZE", 4),
+        acquire_timeout=pool_cfg.get("ACQUIRE_TIMEOUT", 30)
+    )
+    refresher = ReplicaRefresher(
+        app.config["DATABASE"],
+        os.path.join(BASE_DIR, pool_cfg["REPLICA_PATH"]),
+        replica_pool,
+        pool_cfg.get("REPLICA_REFRESH_SECONDS", 30),
+        log=app.logger
+    )
+    app.extensions["db_replica"] = refresher
+
+
+def _mark_write():
+    if has_request_context():
+        session["last_write"] = time.time()
+
+
+def _wrote_recently(lag: float) -> bool:
+    return has_request_context() and time.time() - session.get("last_write", 0) < lag
+
+
 def get_db():
-    conn = sqlite3.connect(app.config["DATABASE"], timeout=10)
-    conn.row_factory = sqlite3.Row
+    _mark_write()
+    return current_app.extensions["db_writer"].acquire()
+
+
+def get_read_db():
+    pool = current_app.extensions["db_read_pool"]
+    replica = current_app.extensions.get("db_replica")
+    if replica is not None:
+        replica.start()
+        if not _wrote_recently(2 * replica.interval):
+            pool = replica.pool
+    conn = pool.acquire()
+    g.setdefault("read_leases", []).append((pool, conn, conn.lease))
     return conn
 
 
@@ -64,6 +212,9 @@ def init_db():
     conn = get_db()
     cur = conn.cursor()
 
+    # WAL: читатели не блокируют писателя и наоборот
+    cur.execute("PRAGMA journal_mode = WAL")
+
     cur.execute("""
         CREATE TABLE IF NOT EXISTS patients (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -91,6 +242,17 @@ def init_db():
         )
     """)
 
+    # индексы по внешним ключам: без них проверка FK при удалении
+    # диагноза/пациента превращается в полный скан patient_diagnoses
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_diagnoses_diagnosis_id
+        ON patient_diagnoses (diagnosis_id)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_diagnoses_patient_id
+        ON patient_diagnoses (patient_id)
+    """)
+
     conn.commit()
     conn.close()
 
@@ -164,22 +326,89 @@ def update_diagnosis(did: int, name: str):
     conn.close()
 
 
-def delete_diagnosis(did: int):
+def delete_diagnosis(did: int, cascade: bool = False, batch_size: int = DELETE_BATCH_SIZE):
+    if cascade:
+        # удаляем назначения пачками; писатель отпускаем после каждой пачки,
+        # чтобы между ними успевали проходить другие записи
+        while True:
+            conn = get_db()
+            cur = conn.execute("""
+                DELETE FROM patient_diagnoses WHERE id IN (
+                    SELECT id FROM patient_diagnoses WHERE diagnosis_id=? LIMIT ?
+                )
+            """, (did, batch_size))
+            deleted = cur.rowcount
+            conn.commit()
+            conn.close()
+            if deleted < batch_size:
+                break
+
+    # назначенный диагноз не даст удалить FOREIGN KEY — в том числе если его
+    # назначили заново, пока шла каскадная очистка
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("DELETE FROM diagnoses WHERE id=?", (did,))
-    conn.commit()
+    try:
+        cur.execute("DELETE FROM diagnoses WHERE id=?", (did,))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.close()
+        raise ValueError("Диагноз назначен пациентам, удаление невозможно")
     conn.close()
 
 
+def delete_diagnosis_in_background(did: int) -> threading.Thread:
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                delete_diagnosis(did, cascade=True)
+                app.logger.info("Диагноз %s удалён вместе с назначениями", did)
+            except (ValueError, PoolTimeout) as e:
+                app.logger.warning("Не удалось удалить диагноз %s: %s", did, e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
 def add_diagnosis_to_patient(pid: int, diagnosis: str, diag_date: str):
     if not validate_diagnosis_text(diagnosis):
         raise ValueError("Некорректный диагноз")
     if not validate_date_not_future(diag_date):
         raise ValueError("Некорректная дата")
 
+    write_queue = current_app.extensions.get("write_queue")
+    if write_queue is not None:
+        _mark_write()
+        # запрос получает ответ только после group commit пачки с этой записью
+        future = write_queue.submit(
+            lambda conn: _insert_patient_diagnosis(conn.cursor(), pid, diagnosis, diag_date)
+        )
+        try:
+            future.result(timeout=WRITE_BEHIND_TIMEOUT)
+        except FutureTimeout:
+            # запись ещё может зафиксироваться — не предлагаем просто повторить
+            raise ValueError(
+                "Назначение ещё не подтверждено. Проверьте карточку пациента "
+                "перед повторной отправкой"
+            )
+        return
+
     conn = get_db()
-    cur = conn.cursor()
+    try:
+        _insert_patient_diagnosis(conn.cursor(), pid, diagnosis, diag_date)
+    except ValueError:
+        conn.close()
+        raise
+    conn.commit()
+    conn.close()
+
+
+def _insert_patient_diagnosis(cur, pid: int, diagnosis: str, diag_date: str):
+    cur.execute("SELECT 1 FROM patients WHERE id=?", (pid,))
+    if not cur.fetchone():
+        raise ValueError("Пациент не найден")
 
     # диагноз: берём существующий или создаём новый
     cur.execute("SELECT id FROM diagnoses WHERE diagnosis=?", (diagnosis,))
@@ -195,9 +424,6 @@ def add_diagnosis_to_patient(pid: int, diagnosis: str, diag_date: str):
         VALUES (?, ?, ?)
     """, (pid, diag_id, diag_date))
 
-    conn.commit()
-    conn.close()
-
 
 def delete_patient_diagnosis(pd_id: int) -> int:
     conn = get_db()
@@ -215,22 +441,68 @@ def delete_patient_diagnosis(pd_id: int) -> int:
     conn.close()
     return pid
 
+
+def check_consistency(repair: bool = False, batch_size: int = DELETE_BATCH_SIZE) -> dict:
+    """
+    Ищет назначения, ссылающиеся на несуществующих пациентов или диагнозы.
+    При repair=True удаляет их пачками.
+    """
+    # foreign_key_check проходит таблицу один раз и ищет родителя по PRIMARY KEY;
+    # сканируем основную базу (пул чтения может смотреть в отстающую реплику)
+    # отдельным соединением только для чтения, не занимая писателя
+    conn = sqlite3.connect(ro_uri(current_app.config["DATABASE"]), uri=True)
+    conn.row_factory = sqlite3.Row
+    orphans = {"patients": set(), "diagnoses": set()}
+    for row in conn.execute("PRAGMA foreign_key_check(patient_diagnoses)"):
+        orphans[row["parent"]].add(row["rowid"])
+    conn.close()
+
+    ids = sorted(orphans["patients"] | orphans["diagnoses"])
+    removed = 0
+    if repair:
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            placeholders = ",".join("?" * len(chunk))
+            conn = get_db()
+            # повторно проверяем ссылки: скан шёл вне транзакции писателя
+            cur = conn.execute(f"""
+                DELETE FROM patient_diagnoses
+                WHERE id IN ({placeholders})
+                  AND (patient_id NOT IN (SELECT id FROM patients)
+                       OR diagnosis_id NOT IN (SELECT id FROM diagnoses))
+            """, chunk)
+            removed += cur.rowcount
+            conn.commit()
+            conn.close()
+    return {
+        "missing_patients": len(orphans["patients"]),
+        "missing_diagnoses": len(orphans["diagnoses"]),
+        "removed": removed
+    }
+
 # ============================================================
 # ROUTES
 # ============================================================
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("index.html")
 
 
+@bp.app_errorhandler(PoolTimeout)
+def pool_timeout(e):
+    # все соединения заняты: просим повторить, а не отдаём 500
+    current_app.logger.warning("Нет свободного соединения: %s", e)
+    return "Сервис перегружен, повторите запрос позже", 503, {"Retry-After": "1"}
+
+
 # --------------------- PATIENTS ---------------------
-@app.route("/patients")
+@bp.route("/patients")
 def patients():
     page = int(request.args.get("page", 1))
     per_page = 10
     offset = (page - 1) * per_page
 
-    conn = get_db()
+    conn = get_read_db()
     cur = conn.cursor()
 
     cur.execute("SELECT COUNT(*) FROM patients")
@@ -254,7 +526,7 @@ def patients():
     )
 
 
-@app.route("/patients/add", methods=["POST"])
+@bp.route("/patients/add", methods=["POST"])
 def add_patient():
     try:
         create_patient(
@@ -268,20 +540,20 @@ def add_patient():
     return redirect("/patients")
 
 
-@app.route("/patients/<int:pid>/delete")
+@bp.route("/patients/<int:pid>/delete")
 def remove_patient(pid):
     delete_patient(pid)
     flash("Пациент удалён")
     return redirect("/patients")
 
 
-@app.route("/patients/<int:pid>")
+@bp.route("/patients/<int:pid>")
 def patient_card(pid):
     page = int(request.args.get("page", 1))
     per_page = 5
     offset = (page - 1) * per_page
 
-    conn = get_db()
+    conn = get_read_db()
     cur = conn.cursor()
 
     cur.execute("SELECT * FROM patients WHERE id=?", (pid,))
@@ -323,7 +595,7 @@ def patient_card(pid):
     )
 
 
-@app.route("/patients/<int:pid>/assign", methods=["POST"])
+@bp.route("/patients/<int:pid>/assign", methods=["POST"])
 def assign_diagnosis(pid):
     try:
         add_diagnosis_to_patient(
@@ -337,7 +609,7 @@ def assign_diagnosis(pid):
     return redirect(f"/patients/{pid}")
 
 
-@app.route("/patient_diagnosis/<int:pd_id>/delete")
+@bp.route("/patient_diagnosis/<int:pd_id>/delete")
 def remove_patient_diagnosis(pd_id):
     try:
         pid = delete_patient_diagnosis(pd_id)
@@ -349,13 +621,13 @@ def remove_patient_diagnosis(pd_id):
 
 
 # --------------------- DIAGNOSES ---------------------
-@app.route("/diagnoses")
+@bp.route("/diagnoses")
 def diagnoses():
     page = int(request.args.get("page", 1))
     per_page = 10
     offset = (page - 1) * per_page
 
-    conn = get_db()
+    conn = get_read_db()
     cur = conn.cursor()
 
     cur.execute("SELECT COUNT(*) FROM diagnoses")
@@ -379,7 +651,7 @@ def diagnoses():
     )
 
 
-@app.route("/diagnoses/add", methods=["POST"])
+@bp.route("/diagnoses/add", methods=["POST"])
 def add_diagnosis():
     try:
         create_diagnosis(request.form.get("diagnosis"))
@@ -389,7 +661,7 @@ def add_diagnosis():
     return redirect("/diagnoses")
 
 
-@app.route("/diagnoses/<int:did>/edit", methods=["POST"])
+@bp.route("/diagnoses/<int:did>/edit", methods=["POST"])
 def edit_diagnosis(did):
     try:
         update_diagnosis(did, request.form.get("diagnosis"))
@@ -399,20 +671,87 @@ def edit_diagnosis(did):
     return redirect("/diagnoses")
 
 
-@app.route("/diagnoses/<int:did>/delete")
+@bp.route("/diagnoses/<int:did>/delete")
 def remove_diagnosis(did):
-    delete_diagnosis(did)
-    flash("Диагноз удалён")
+    if request.args.get("cascade") == "1":
+        delete_diagnosis_in_background(did)
+        flash("Диагноз и его назначения удаляются в фоне")
+        return redirect("/diagnoses")
+    try:
+        delete_diagnosis(did)
+        flash("Диагноз удалён")
+    except ValueError as e:
+        flash(str(e))
     return redirect("/diagnoses")
 
 
+# --------------------- ADMIN ---------------------
+def backup_in_background():
+    """
+    Запускает копию в фоне. Если копия уже идёт, возвращает None:
+    повторные нажатия не должны плодить параллельные копии.
+    """
+    # backup нужен только администратору — не грузим его при старте воркера
+    from backup import backup_from_config, backup_running
+
+    if backup_running():
+        return None
+
+    app = current_app._get_current_object()
+
+    def run():
+        try:
+            result = backup_from_config(app.config["DATABASE"], app.config.get("BACKUP", {}))
+            app.logger.info(
+                "Резервная копия %s: копирование %.3f c, проверка %.3f c, сжатие %.3f c",
+                result["path"], result["backup_seconds"],
+                result["verify_seconds"], result["compress_seconds"]
+            )
+        except (sqlite3.Error, OSError, RuntimeError) as e:
+            app.logger.error("Ошибка резервного копирования: %s", e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    app.extensions["backup_thread"] = thread
+    return thread
+
+
+@bp.route("/admin/metrics")
+def admin_metrics():
+    write_queue = current_app.extensions.get("write_queue")
+    return jsonify({
+        "write_behind": write_queue is not None,
+        "write_queue": write_queue.metrics() if write_queue is not None else None
+    })
+
+
+@bp.route("/admin/backup", methods=["POST"])
+def admin_backup():
+    if backup_in_background() is None:
+        flash("Резервное копирование уже выполняется")
+    else:
+        flash("Резервное копирование запущено")
+    return redirect("/")
+
+
+# ============================================================
+# CLI
+# ============================================================
+@bp.cli.command("check-db")
+@click.option("--repair", is_flag=True, help="Удалить найденные висящие назначения")
+def check_db_command(repair):
+    """Проверка ссылочной целостности patient_diagnoses."""
+    result = check_consistency(repair=repair)
+    click.echo(
+        f"Нет пациента: {result['missing_patients']}, "
+        f"нет диагноза: {result['missing_diagnoses']}, "
+        f"удалено: {result['removed']}"
+    )
+
+
 # ============================================================
 # RUN
 # ============================================================
 if __name__ == "__main__":
-    init_db()
-    app.run(
-        host=CONFIG["host"],
-        port=CONFIG["port"],
-        debug=CONFIG["debug"]
-    )
+    app = create_app()
+    app.run(**app.config["SERVER"])
@@ -1,10 +1,16 @@
 import unittest
 import sqlite3
 import tempfile
+import shutil
+import json
+import threading
+import time
 import os
 from datetime import date
+from concurrent.futures import Future
+from unittest import mock
 
-from app import app, get_db
+from app import create_app, get_db, get_read_db, delete_diagnosis, check_consistency
 
 class AppTestCase(unittest.TestCase):
 
@@ -15,10 +21,11 @@ class AppTestCase(unittest.TestCase):
         # создаём временный файл базы данных
         self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
 
-        app.config["DATABASE"] = self.db_path
-        app.config["TESTING"] = True
-
-        self.client = app.test_client()
+        self.app = create_app({
+            "DATABASE": self.db_path,
+            "TESTING": True
+        })
+        self.client = self.app.test_client()
 
         # создаём таблицы
         self._create_tables()
@@ -75,13 +82,14 @@ class AppTestCase(unittest.TestCase):
         })
 
         # используем ТО ЖЕ подключение, что и приложение
-        conn = get_db()
-        cur = conn.cursor()
+        with self.app.app_context():
+            conn = get_db()
+            cur = conn.cursor()
 
-        cur.execute("SELECT name, last_name, birth_date FROM patients")
-        patient = cur.fetchone()
+            cur.execute("SELECT name, last_name, birth_date FROM patients")
+            patient = cur.fetchone()
 
-        conn.close()
+            conn.close()
 
         self.assertIsNotNone(patient)
         self.assertEqual(patient[0], "Иван")
@@ -93,7 +101,7 @@ class AppTestCase(unittest.TestCase):
     # --------------------------------------------------
     def test_delete_patient(self):
         self.client.post("/patients/add", data={
-            "name": "Иван",
+            "first_name": "Иван",
             "last_name": "Петров",
             "birth_year": "01.01.2000"
         })
@@ -113,7 +121,7 @@ class AppTestCase(unittest.TestCase):
     # --------------------------------------------------
     def test_add_diagnosis_to_patient_card(self):
         self.client.post("/patients/add", data={
-            "name": "Анна",
+            "first_name": "Анна",
             "last_name": "Иванова",
             "birth_year": "02.02.2002"
         })
@@ -143,7 +151,7 @@ class AppTestCase(unittest.TestCase):
     # --------------------------------------------------
     def test_delete_diagnosis_from_patient_card(self):
         self.client.post("/patients/add", data={
-            "name": "Петр",
+            "first_name": "Петр",
             "last_name": "Сидоров",
             "birth_year": "03.03.2003"
         })
@@ -201,5 +209,319 @@ class AppTestCase(unittest.TestCase):
         self.assertIsNone(row)
 
 
+    # --------------------------------------------------
+    # 6. Диагноз, назначенный пациенту, не удаляется
+    # --------------------------------------------------
+    def test_delete_used_diagnosis_refused(self):
+        self.client.post("/patients/add", data={
+            "first_name": "Олег",
+            "last_name": "Смирнов",
+            "birth_year": "04.04.2004"
+        })
+        self.client.post("/patients/1/assign", data={
+            "diagnosis": "Ангина",
+            "diagnosis_date": date.today().isoformat()
+        })
+
+        self.client.get("/diagnoses/1/delete")
+        with self.app.app_context():
+            with self.assertRaises(ValueError):
+                delete_diagnosis(1)
+
+        conn = sqlite3.connect(self.db_path)
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM diagnoses")
+        diagnoses = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM patient_diagnoses")
+        links = cur.fetchone()[0]
+        conn.close()
+
+        self.assertEqual(diagnoses, 1)
+        self.assertEqual(links, 1)
+
+    # --------------------------------------------------
+    # 7. Каскадное удаление диагноза пачками
+    # --------------------------------------------------
+    def test_delete_diagnosis_cascade(self):
+        self.client.post("/patients/add", data={
+            "first_name": "Олег",
+            "last_name": "Смирнов",
+            "birth_year": "04.04.2004"
+        })
+        today = date.today().isoformat()
+        for _ in range(5):
+            self.client.post("/patients/1/assign", data={
+                "diagnosis": "Ангина",
+                "diagnosis_date": today
+            })
+
+        with self.app.app_context():
+            delete_diagnosis(1, cascade=True, batch_size=2)
+
+        conn = sqlite3.connect(self.db_path)
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM diagnoses")
+        diagnoses = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM patient_diagnoses")
+        links = cur.fetchone()[0]
+        conn.close()
+
+        self.assertEqual(diagnoses, 0)
+        self.assertEqual(links, 0)
+
+    # --------------------------------------------------
+    # 8. Поиск и удаление висящих назначений
+    # --------------------------------------------------
+    def test_check_consistency_repairs_orphans(self):
+        conn = sqlite3.connect(self.db_path)
+        cur = conn.cursor()
+        cur.execute("INSERT INTO patients (name, last_name, birth_date) VALUES ('Иван', 'Петров', '2000-01-01')")
+        cur.execute("INSERT INTO diagnoses (diagnosis) VALUES ('Грипп')")
+        cur.execute("INSERT INTO patient_diagnoses (patient_id, diagnosis_id, diagnosis_date) VALUES (1, 1, '2024-01-01')")
+        cur.execute("INSERT INTO patient_diagnoses (patient_id, diagnosis_id, diagnosis_date) VALUES (1, 99, '2024-01-01')")
+        cur.execute("INSERT INTO patient_diagnoses (patient_id, diagnosis_id, diagnosis_date) VALUES (42, 1, '2024-01-01')")
+        conn.commit()
+        conn.close()
+
+        with self.app.app_context():
+            result = check_consistency()
+            self.assertEqual(result["missing_patients"], 1)
+            self.assertEqual(result["missing_diagnoses"], 1)
+            self.assertEqual(result["removed"], 0)
+
+            result = check_consistency(repair=True, batch_size=1)
+            self.assertEqual(result["removed"], 2)
+            self.assertEqual(check_consistency()["missing_diagnoses"], 0)
+
+
+    # --------------------------------------------------
+    # 9. Назначение диагноза через очередь отложенной записи
+    # --------------------------------------------------
+    def test_assign_diagnosis_write_behind(self):
+        self.app = create_app({
+            "DATABASE": self.db_path,
+            "TESTING": True,
+            "WRITE_BEHIND": {"ENABLED": True, "MAX_DELAY_MS": 1}
+        })
+        self.client = self.app.test_client()
+
+        self.client.post("/patients/add", data={
+            "first_name": "Анна",
+            "last_name": "Иванова",
+            "birth_year": "02.02.2002"
+        })
+        self.client.post("/patients/1/assign", data={
+            "diagnosis": "ОРВИ",
+            "diagnosis_date": date.today().isoformat()
+        })
+        # несуществующий пациент — ошибка не должна задеть остальные записи
+        self.client.post("/patients/2/assign", data={
+            "diagnosis": "Грипп",
+            "diagnosis_date": date.today().isoformat()
+        })
+
+        conn = sqlite3.connect(self.db_path)
+        cur = conn.cursor()
+        cur.execute("SELECT patient_id FROM patient_diagnoses")
+        rows = cur.fetchall()
+        conn.close()
+
+        self.assertEqual(rows, [(1,)])
+        metrics = self.client.get("/admin/metrics").get_json()
+        self.assertTrue(metrics["write_behind"])
+        self.assertEqual(metrics["write_queue"]["items"], 2)
+        self.app.extensions["write_queue"].stop()
+
+
+    # --------------------------------------------------
+    # 10. Резервная копия через админский маршрут
+    # --------------------------------------------------
+    def test_admin_backup(self):
+        backup_dir = tempfile.mkdtemp()
+        self.app.config["BACKUP"] = {"DIR": backup_dir, "STEP_SLEEP": 0}
+
+        response = self.client.post("/admin/backup")
+        self.app.extensions["backup_thread"].join(timeout=10)
+
+        snapshots = os.listdir(backup_dir)
+        shutil.rmtree(backup_dir, ignore_errors=True)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(snapshots), 1)
+
+
+    # --------------------------------------------------
+    # 11. Ошибка запроса не оставляет соединение чтения занятым
+    # --------------------------------------------------
+    def test_failed_read_returns_connection(self):
+        self.app = create_app({
+            "DATABASE": self.db_path,
+            "TESTING": True,
+            "READ_POOL": {"SIZE": 1, "ACQUIRE_TIMEOUT": 1}
+        })
+
+        for _ in range(3):
+            with self.app.app_context():
+                conn = get_read_db()
+                with self.assertRaises(sqlite3.OperationalError):
+                    conn.execute("SELECT * FROM missing_table")
+
+        response = self.app.test_client().get("/patients")
+        self.assertEqual(response.status_code, 200)
+
+
+    # --------------------------------------------------
+    # 12. Таймаут отложенной записи не превращается в 500
+    # --------------------------------------------------
+    def test_assign_diagnosis_write_behind_timeout(self):
+        self.client.post("/patients/add", data={
+            "first_name": "Анна",
+            "last_name": "Иванова",
+            "birth_year": "02.02.2002"
+        })
+
+        # очередь, которая никогда не подтверждает запись
+        stuck_queue = mock.Mock()
+        stuck_queue.submit.return_value = Future()
+        self.app.extensions["write_queue"] = stuck_queue
+
+        with mock.patch("app.WRITE_BEHIND_TIMEOUT", 0.01):
+            response = self.client.post("/patients/1/assign", data={
+                "diagnosis": "ОРВИ",
+                "diagnosis_date": date.today().isoformat()
+            })
+
+        self.assertEqual(response.status_code, 302)
+        with self.client.session_transaction() as session:
+            messages = [m for _, m in session.get("_flashes", [])]
+        self.assertTrue(any("ещё не подтверждено" in m for m in messages))
+
+
+
+    # --------------------------------------------------
+    # 13. После create_app не остаётся соединений и потоков до fork
+    # --------------------------------------------------
+    def test_create_app_leaves_nothing_open_before_fork(self):
+        tmp_dir = tempfile.mkdtemp()
+        config_path = os.path.join(tmp_dir, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "host": "127.0.0.1", "port": 5000, "debug": False,
+                "database": os.path.join(tmp_dir, "clinic.db"),
+                "LOGGING": {
+                    "LOG_FILE": os.path.join(tmp_dir, "logs", "service.log"),
+                    "MAX_BYTES": 100000, "BACKUP_COUNT": 1
+                },
+                "READ_POOL": {"REPLICA_PATH": os.path.join(tmp_dir, "replica.db")},
+                "WRITE_BEHIND": {"ENABLED": True}
+            }, f)
+
+        app = create_app(config_path=config_path)
+        try:
+            self.assertIsNone(app.extensions["db_writer"]._conn)
+            self.assertIsNone(app.extensions["write_queue"]._thread)
+            self.assertIsNone(app.extensions["db_replica"]._thread)
+        finally:
+            for handler in app.logger.handlers[:]:
+                handler.close()
+                app.logger.removeHandler(handler)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+
+    # --------------------------------------------------
+    # 14. Занятый писатель — 503, а не бесконечное ожидание
+    # --------------------------------------------------
+    def test_busy_writer_returns_503(self):
+        self.app = create_app({
+            "DATABASE": self.db_path,
+            "TESTING": True,
+            "WRITER": {"ACQUIRE_TIMEOUT": 0.05}
+        })
+        writer = self.app.extensions["db_writer"]
+        held = threading.Event()
+        done = threading.Event()
+
+        def hold():
+            conn = writer.acquire()
+            held.set()
+            done.wait(5)
+            conn.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait(5)
+        try:
+            response = self.app.test_client().post("/diagnoses/add", data={"diagnosis": "ОРВИ"})
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+
+
+    # --------------------------------------------------
+    # 15. Проверка целостности не читает отстающую реплику
+    # --------------------------------------------------
+    def test_check_consistency_ignores_stale_replica(self):
+        stale_path = self.db_path + ".stale"
+        shutil.copyfile(self.db_path, stale_path)
+        self.app.extensions["db_read_pool"].switch(stale_path)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO patient_diagnoses (patient_id, diagnosis_id, diagnosis_date) VALUES (42, 99, '2024-01-01')")
+        conn.commit()
+        conn.close()
+
+        try:
+            with self.app.app_context():
+                result = check_consistency(repair=True)
+        finally:
+            self.app.extensions["db_read_pool"].close_all()
+            os.remove(stale_path)
+
+        self.assertEqual(result["missing_patients"], 1)
+        self.assertEqual(result["removed"], 1)
+
+
+    # --------------------------------------------------
+    # 16. С репликой после записи сессия видит свои данные
+    # --------------------------------------------------
+    def test_replica_read_your_writes(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            "DATABASE": self.db_path,
+            "TESTING": True,
+            "READ_POOL": {
+                "REPLICA_PATH": os.path.join(tmp_dir, "replica.db"),
+                "REPLICA_REFRESH_SECONDS": 60
+            }
+        })
+        replica = self.app.extensions["db_replica"]
+        client = self.app.test_client()
+
+        # первое чтение запускает обновление; ждём первую копию
+        self.assertEqual(client.get("/patients").status_code, 200)
+        deadline = time.monotonic() + 5
+        while replica.pool.path == self.db_path and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertNotEqual(replica.pool.path, self.db_path)
+
+        try:
+            client.post("/patients/add", data={
+                "first_name": "Анна",
+                "last_name": "Иванова",
+                "birth_year": "02.02.2002"
+            })
+            # своя запись видна сразу, хотя реплика ещё старая
+            self.assertEqual(client.get("/patients/1").status_code, 200)
+            self.assertEqual(self.app.test_client().get("/patients/1").status_code, 404)
+        finally:
+            replica.stop()
+            replica.pool.close_all()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
 if __name__ == "__main__":
     unittest.main()
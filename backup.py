@@ -0,0 +1,267 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+from db_pool import ro_uri
+
+# config.json ищем рядом с backup.py, а не в текущем каталоге процесса
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG_PATH = os.path.join(BASE_DIR, "config.json")
+
+# -------------------------
+# Настройки по умолчанию
+# -------------------------
+DEFAULT_BACKUP_DIR = "backups"
+DEFAULT_PAGES_PER_STEP = 256
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_STEP_SLEEP = 0.01
+DEFAULT_KEEP = 10
+
+# в процессе одновременно выполняется не больше одной копии
+_backup_lock = threading.Lock()
+
+
+class BackupInProgress(RuntimeError):
+    pass
+
+
+def backup_running() -> bool:
+    return _backup_lock.locked()
+
+
+# -------------------------
+# Онлайн-копия базы
+# -------------------------
+def backup_database(db_path: str, backup_dir: str = DEFAULT_BACKUP_DIR,
+                    pages_per_step: int = DEFAULT_PAGES_PER_STEP,
+                    step_sleep: float = DEFAULT_STEP_SLEEP,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    compress: bool = False,
+                    keep: int = DEFAULT_KEEP) -> dict:
+    """
+    Снимает копию базы, проверяет её PRAGMA integrity_check и удаляет
+    старые снимки.
+
+    База в режиме WAL копируется backup API по pages_per_step страниц
+    с паузой step_sleep после каждого шага. Всё это время источник держит
+    открытую транзакцию чтения: копия берётся из одного снимка и не начинается
+    заново при записи, а сама запись не блокируется. В остальных режимах журнала
+    такая транзакция остановила бы запись на всё время копирования, поэтому
+    копия снимается одним VACUUM INTO — без пауз.
+
+    При сжатии пауза step_sleep делается и между блоками по chunk_size байт.
+    """
+    if not _backup_lock.acquire(blocking=False):
+        raise BackupInProgress("Резервное копирование уже выполняется")
+    try:
+        return _backup_database(db_path, backup_dir, pages_per_step, step_sleep,
+                                chunk_size, compress, keep)
+    finally:
+        _backup_lock.release()
+
+
+def _copy_database(db_path: str, target: str, pages_per_step: int, step_sleep: float):
+    # mode=ro: несуществующий файл — ошибка, а не новая пустая база
+    src = sqlite3.connect(ro_uri(db_path), uri=True, timeout=10, isolation_level=None)
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            src.execute("VACUUM INTO ?", (target,))
+            return
+
+        # транзакция чтения фиксирует снимок на всё время копирования
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def pause(status, remaining, total):
+            if remaining:
+                time.sleep(step_sleep)
+
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst, pages=pages_per_step, progress=pause)
+            # копия — отдельный файл, без -wal и -shm рядом
+            dst.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            dst.close()
+        src.execute("COMMIT")
+    finally:
+        src.close()
+
+
+def _backup_database(db_path, backup_dir, pages_per_step, step_sleep,
+                     chunk_size, compress, keep) -> dict:
+    # иначе при неверном пути получили бы "копию" пустой базы
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(f"База данных не найдена: {db_path}")
+
+    os.makedirs(backup_dir, exist_ok=True)
+
+    prefix = os.path.splitext(os.path.basename(db_path))[0]
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    target = os.path.join(backup_dir, f"{prefix}-{stamp}.db")
+
+    started = time.perf_counter()
+    try:
+        _copy_database(db_path, target, pages_per_step, step_sleep)
+    except sqlite3.Error:
+        if os.path.exists(target):
+            os.remove(target)
+        raise
+    backup_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    integrity = integrity_check(target)
+    verify_seconds = time.perf_counter() - started
+    if integrity != "ok":
+        os.remove(target)
+        raise RuntimeError(f"Копия базы повреждена: {integrity}")
+
+    compress_seconds = 0.0
+    if compress:
+        started = time.perf_counter()
+        with open(target, "rb") as f_in, gzip.open(target + ".gz", "wb") as f_out:
+            while True:
+                chunk = f_in.read(chunk_size)
+                if not chunk:
+                    break
+                f_out.write(chunk)
+                time.sleep(step_sleep)
+        os.remove(target)
+        target += ".gz"
+        compress_seconds = time.perf_counter() - started
+
+    removed = rotate_backups(backup_dir, prefix, keep)
+
+    return {
+        "path": target,
+        "size": os.path.getsize(target),
+        "backup_seconds": backup_seconds,
+        "verify_seconds": verify_seconds,
+        "compress_seconds": compress_seconds,
+        "removed": removed
+    }
+
+
+def backup_from_config(db_path: str, backup_cfg: dict, **overrides) -> dict:
+    """
+    Запускает backup_database с параметрами из секции BACKUP config.json.
+    Непустые overrides (например, из аргументов CLI) имеют приоритет.
+    """
+    params = {
+        "backup_dir": backup_cfg.get("DIR", DEFAULT_BACKUP_DIR),
+        "pages_per_step": backup_cfg.get("PAGES_PER_STEP", DEFAULT_PAGES_PER_STEP),
+        "step_sleep": backup_cfg.get("STEP_SLEEP", DEFAULT_STEP_SLEEP),
+        "chunk_size": backup_cfg.get("CHUNK_SIZE", DEFAULT_CHUNK_SIZE),
+        "compress": backup_cfg.get("COMPRESS", False),
+        "keep": backup_cfg.get("KEEP", DEFAULT_KEEP)
+    }
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    return backup_database(db_path, **params)
+
+
+# -------------------------
+# Проверка целостности копии
+# -------------------------
+def integrity_check(path: str) -> str:
+    """
+    Возвращает результат PRAGMA integrity_check ("ok" для целой базы).
+    Сжатые снимки (.gz) предварительно распаковываются во временный файл.
+    """
+    if not path.endswith(".gz"):
+        conn = sqlite3.connect(ro_uri(path), uri=True)
+        try:
+            rows = conn.execute("PRAGMA integrity_check").fetchall()
+        finally:
+            conn.close()
+        return "\n".join(r[0] for r in rows)
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".db")
+    try:
+        with os.fdopen(fd, "wb") as f_out, gzip.open(path, "rb") as f_in:
+            shutil.copyfileobj(f_in, f_out)
+        return integrity_check(tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+
+# -------------------------
+# Ротация снимков
+# -------------------------
+def rotate_backups(backup_dir: str, prefix: str, keep: int) -> list:
+    """
+    Оставляет keep последних снимков с данным префиксом, остальные удаляет.
+    Имена содержат отметку времени, поэтому сортировка по имени = по времени.
+    """
+    snapshots = sorted(
+        name for name in os.listdir(backup_dir)
+        if name.startswith(prefix + "-") and (name.endswith(".db") or name.endswith(".db.gz"))
+    )
+    removed = snapshots[:-keep] if keep > 0 else []
+    for name in removed:
+        os.remove(os.path.join(backup_dir, name))
+    return removed
+
+
+# -------------------------
+# CLI
+# -------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Онлайн-копия базы клиники")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    parser.add_argument("--database")
+    parser.add_argument("--dir")
+    parser.add_argument("--pages", type=int, help="страниц за шаг копирования")
+    parser.add_argument("--sleep", type=float,
+                        help="пауза после шага копирования и блока сжатия, с")
+    parser.add_argument("--keep", type=int)
+    parser.add_argument("--compress", action="store_true")
+    parser.add_argument("--verify", metavar="SNAPSHOT",
+                        help="только проверить существующий снимок")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        started = time.perf_counter()
+        result = integrity_check(args.verify)
+        print(f"{args.verify}: {result} ({time.perf_counter() - started:.3f} c)")
+        return 0 if result == "ok" else 1
+
+    with open(args.config, encoding="utf-8") as f:
+        config = json.load(f)
+
+    # относительные пути из конфига — от каталога конфига, как в create_app()
+    config_dir = os.path.dirname(os.path.abspath(args.config))
+    backup_cfg = dict(config.get("BACKUP", {}))
+    backup_cfg["DIR"] = os.path.join(config_dir, backup_cfg.get("DIR", DEFAULT_BACKUP_DIR))
+
+    try:
+        result = backup_from_config(
+            args.database or os.path.join(config_dir, config["database"]),
+            backup_cfg,
+            backup_dir=args.dir,
+            pages_per_step=args.pages,
+            step_sleep=args.sleep,
+            compress=args.compress or None,
+            keep=args.keep
+        )
+    except (FileNotFoundError, BackupInProgress) as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    print(f"Снимок: {result['path']} ({result['size']} байт)")
+    print(f"Копирование: {result['backup_seconds']:.3f} c, "
+          f"проверка: {result['verify_seconds']:.3f} c, "
+          f"сжатие: {result['compress_seconds']:.3f} c")
+    for name in result["removed"]:
+        print(f"Удалён старый снимок: {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
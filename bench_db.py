@@ -0,0 +1,181 @@
+import os
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+import statistics
+
+from app import create_app
+
+# запросы карточки пациента — самая частая операция чтения
+READ_QUERIES = [
+    ("SELECT * FROM patients WHERE id=?", lambda pid: (pid,)),
+    ("SELECT COUNT(*) FROM patient_diagnoses WHERE patient_id=?", lambda pid: (pid,)),
+    ("""
+        SELECT pd.id, d.diagnosis, pd.diagnosis_date
+        FROM patient_diagnoses pd
+        JOIN diagnoses d ON d.id = pd.diagnosis_id
+        WHERE pd.patient_id=?
+        ORDER BY pd.diagnosis_date DESC
+        LIMIT 5
+    """, lambda pid: (pid,)),
+]
+
+WRITE_QUERY = """
+    INSERT INTO patient_diagnoses (patient_id, diagnosis_id, diagnosis_date)
+    VALUES (?, ?, '2024-01-01')
+"""
+
+
+# -------------------------
+# Подготовка данных
+# -------------------------
+def seed(path: str, patients: int, diagnoses: int):
+    """
+    Схема, индексы и режим журнала как после init_db(): обе ветки замера
+    отличаются только способом получения соединений.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript("""
+        CREATE TABLE patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL, last_name TEXT NOT NULL, birth_date TEXT NOT NULL
+        );
+        CREATE TABLE diagnoses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            diagnosis TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE patient_diagnoses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL, diagnosis_id INTEGER NOT NULL,
+            diagnosis_date TEXT NOT NULL,
+            FOREIGN KEY(patient_id) REFERENCES patients(id),
+            FOREIGN KEY(diagnosis_id) REFERENCES diagnoses(id)
+        );
+        CREATE INDEX idx_patient_diagnoses_diagnosis_id ON patient_diagnoses (diagnosis_id);
+        CREATE INDEX idx_patient_diagnoses_patient_id ON patient_diagnoses (patient_id);
+    """)
+    conn.executemany(
+        "INSERT INTO patients (name, last_name, birth_date) VALUES (?, ?, '2000-01-01')",
+        [(f"Имя{i}", f"Фамилия{i}") for i in range(patients)]
+    )
+    conn.executemany(
+        "INSERT INTO diagnoses (diagnosis) VALUES (?)",
+        [(f"Диагноз {i}",) for i in range(diagnoses)]
+    )
+    conn.commit()
+    conn.close()
+
+
+# -------------------------
+# Нагрузка
+# -------------------------
+def run_workload(open_read, open_write, readers: int, writers: int,
+                 duration: float, patients: int, diagnoses: int, think: float) -> dict:
+    """
+    Замкнутый цикл с паузой think между операциями: без неё читающие потоки
+    в одном процессе забирают GIL и искусственно душат пишущие.
+    """
+    latencies = {"read": [], "write": []}
+    errors = []
+    stop_at = time.perf_counter() + duration
+
+    def reader(n):
+        pid = n
+        while time.perf_counter() < stop_at:
+            pid = pid % patients + 1
+            started = time.perf_counter()
+            conn = open_read()
+            for sql, params in READ_QUERIES:
+                conn.execute(sql, params(pid)).fetchall()
+            conn.close()
+            latencies["read"].append(time.perf_counter() - started)
+            time.sleep(think)
+
+    def writer(n):
+        i = n
+        while time.perf_counter() < stop_at:
+            i += 1
+            started = time.perf_counter()
+            conn = open_write()
+            try:
+                conn.execute(WRITE_QUERY, (i % patients + 1, i % diagnoses + 1))
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            conn.close()
+            latencies["write"].append(time.perf_counter() - started)
+            time.sleep(think)
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    result = {"errors": len(errors)}
+    for kind, values in latencies.items():
+        values.sort()
+        result[kind] = {
+            "ops": len(values) / duration,
+            "p50": statistics.median(values) * 1000 if values else 0,
+            "p95": values[int(len(values) * 0.95)] * 1000 if values else 0
+        }
+    return result
+
+
+def print_result(title: str, result: dict):
+    print(title)
+    for kind in ("read", "write"):
+        r = result[kind]
+        print(f"  {kind:5}: {r['ops']:8.0f} оп/с, p50 {r['p50']:6.2f} мс, p95 {r['p95']:6.2f} мс")
+    print(f"  ошибок блокировки: {result['errors']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Смешанная нагрузка чтение/запись")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--diagnoses", type=int, default=200)
+    parser.add_argument("--think-ms", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # до: новое соединение на каждую операцию, как прежний get_db()
+        before_path = os.path.join(tmp_dir, "before.db")
+        seed(before_path, args.patients, args.diagnoses)
+
+        def open_plain():
+            conn = sqlite3.connect(before_path, timeout=10)
+            conn.execute("PRAGMA foreign_keys = ON")
+            return conn
+
+        before = run_workload(open_plain, open_plain, args.readers, args.writers,
+                              args.duration, args.patients, args.diagnoses,
+                              args.think_ms / 1000)
+        print_result("До (общий get_db):", before)
+
+        # после: пул чтения + единственный писатель
+        after_path = os.path.join(tmp_dir, "after.db")
+        seed(after_path, args.patients, args.diagnoses)
+        app = create_app({"DATABASE": after_path, "READ_POOL": {"SIZE": args.readers}})
+        # потоки нагрузки работают без контекста приложения — берём пул и писателя напрямую
+        after = run_workload(app.extensions["db_read_pool"].acquire,
+                             app.extensions["db_writer"].acquire,
+                             args.readers, args.writers,
+                             args.duration, args.patients, args.diagnoses,
+                             args.think_ms / 1000)
+        print_result("После (пул чтения + писатель):", after)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# целевое время старта воркера: импорт app + create_app()
+DEFAULT_TARGET_MS = 400.0
+
+BOOT_SNIPPET = (
+    "import sys, time; t = time.perf_counter(); "
+    "import app; app.create_app(config_path=sys.argv[1]); "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+# -------------------------
+# Разбор вывода -X importtime
+# -------------------------
+def import_times(module: str) -> list:
+    """
+    Запускает `python -X importtime -c "import <module>"` и возвращает
+    список (накопленное время, мкс; имя модуля), отсортированный по убыванию.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return rows
+
+
+# -------------------------
+# Время старта воркера
+# -------------------------
+def write_bench_config(tmp_dir: str) -> str:
+    """
+    Копия config.json, у которой база, лог и копии лежат во временном
+    каталоге, а реплика отключена: замер не трогает рабочие данные.
+    """
+    with open(os.path.join(BASE_DIR, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+
+    config["database"] = os.path.join(tmp_dir, "clinic.db")
+    config["LOGGING"]["LOG_FILE"] = os.path.join(tmp_dir, "logs", "service.log")
+    config.setdefault("BACKUP", {})["DIR"] = os.path.join(tmp_dir, "backups")
+    config.setdefault("READ_POOL", {})["REPLICA_PATH"] = ""
+
+    path = os.path.join(tmp_dir, "config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return path
+
+
+def boot_time_ms(runs: int) -> list:
+    """
+    Каждый замер — отдельный процесс, как при запуске нового воркера.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config_path = write_bench_config(tmp_dir)
+        times = []
+        for _ in range(runs):
+            proc = subprocess.run(
+                [sys.executable, "-c", BOOT_SNIPPET, config_path],
+                cwd=BASE_DIR, capture_output=True, text=True, check=True
+            )
+            times.append(float(proc.stdout.strip().splitlines()[-1]))
+        return times
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер времени старта приложения")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--target-ms", type=float, default=DEFAULT_TARGET_MS)
+    args = parser.parse_args(argv)
+
+    for module in ("validators", "app"):
+        rows = import_times(module)
+        total = next(us for us, name in rows if name == module)
+        print(f"import {module}: {total / 1000:.1f} мс")
+        if module == "app":
+            for us, name in rows[:args.top]:
+                print(f"  {us / 1000:8.1f} мс  {name}")
+
+    times = boot_time_ms(args.runs)
+    median = statistics.median(times)
+    print(f"Старт воркера (медиана из {args.runs}): {median:.1f} мс, цель {args.target_ms:.0f} мс")
+    return 0 if median <= args.target_ms else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,327 @@
+import os
+import queue
+import itertools
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def ro_uri(path: str) -> str:
+    # as_uri() экранирует пробелы, '?', '#' и прочие символы в пути
+    return Path(path).absolute().as_uri() + "?mode=ro"
+
+
+# ============================================================
+# ПУЛ СОЕДИНЕНИЙ ТОЛЬКО ДЛЯ ЧТЕНИЯ
+# ============================================================
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Соединение, которое при close() возвращается владельцу (пулу или писателю),
+    а не закрывается. Так сервисный код сохраняет привычное get_db() ... close().
+    """
+    owner = None
+    in_use = False
+    lease = None
+    generation = 0
+
+    def close(self):
+        if self.owner is None:
+            super().close()
+        else:
+            self.owner.release(self)
+
+    def close_for_real(self):
+        self.owner = None
+        super().close()
+
+
+class ReadPool:
+    """
+    Пул соединений mode=ro + PRAGMA query_only. Соединения открываются лениво,
+    одновременно выдаётся не больше size штук. Если все заняты дольше
+    acquire_timeout секунд, acquire() бросает PoolTimeout.
+
+    После switch() пул читает новый файл. Когда закрывается последнее
+    соединение со старым файлом, вызывается on_retire(путь_к_старому_файлу).
+    """
+
+    def __init__(self, path: str, size: int = 4, timeout: float = 10,
+                 acquire_timeout: float = 30, on_retire=None):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.on_retire = on_retire
+        self.generation = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # файл и число открытых соединений каждого поколения
+        self._paths = {0: path}
+        self._open_counts = {}
+
+    def _open(self) -> PooledConnection:
+        with self._lock:
+            path, generation = self.path, self.generation
+            self._open_counts[generation] = self._open_counts.get(generation, 0) + 1
+        try:
+            conn = sqlite3.connect(
+                ro_uri(path), uri=True, timeout=self.timeout,
+                check_same_thread=False, factory=PooledConnection
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA query_only = ON")
+        except Exception:
+            self._closed(generation)
+            raise
+        conn.generation = generation
+        return conn
+
+    def _discard(self, conn: PooledConnection):
+        conn.close_for_real()
+        self._closed(conn.generation)
+
+    def _closed(self, generation: int):
+        with self._lock:
+            self._open_counts[generation] -= 1
+            path = self._retired_path(generation)
+        if path is not None and self.on_retire is not None:
+            self.on_retire(path)
+
+    def _retired_path(self, generation: int):
+        # вызывается под self._lock
+        if generation == self.generation or self._open_counts.get(generation, 0):
+            return None
+        self._open_counts.pop(generation, None)
+        return self._paths.pop(generation, None)
+
+    def acquire(self) -> PooledConnection:
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolTimeout("Нет свободных соединений для чтения")
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._open()
+                    break
+                # после переключения реплики старые соединения не переиспользуем
+                if conn.generation != self.generation:
+                    self._discard(conn)
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+        conn.owner = self
+        conn.in_use = True
+        # метка выдачи: release() с чужой меткой не вернёт соединение,
+        # уже выданное кому-то другому
+        conn.lease = object()
+        return conn
+
+    def release(self, conn: PooledConnection, lease=None):
+        """
+        Возвращает соединение в пул. С lease — только если оно всё ещё
+        выдано по этой метке; повторный возврат ничего не делает.
+        """
+        with self._lock:
+            if not conn.in_use or (lease is not None and conn.lease is not lease):
+                return
+            conn.in_use = False
+            conn.lease = None
+        if conn.in_transaction:
+            conn.rollback()
+        if conn.generation == self.generation:
+            self._idle.put(conn)
+        else:
+            self._discard(conn)
+        self._slots.release()
+
+    def switch(self, path: str):
+        """
+        Переключает пул на другой файл (например, обновлённую реплику).
+        Свободные соединения со старым файлом закрываются сразу, выданные —
+        при возврате в пул.
+        """
+        with self._lock:
+            previous = self.generation
+            self.generation += 1
+            self.path = path
+            self._paths[self.generation] = path
+        self.close_all()
+        with self._lock:
+            retired = self._retired_path(previous)
+        if retired is not None and self.on_retire is not None:
+            self.on_retire(retired)
+
+    def close_all(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+# ============================================================
+# ЕДИНСТВЕННЫЙ ПИСАТЕЛЬ
+# ============================================================
+class Writer:
+    """
+    Одно соединение на запись на процесс. get_db() захватывает его под
+    блокировкой, close() освобождает — записи потоков идут строго по очереди
+    и не борются друг с другом за блокировку SQLite через busy timeout.
+    Если писатель занят дольше acquire_timeout секунд, acquire() бросает
+    PoolTimeout.
+    """
+
+    def __init__(self, path: str, timeout: float = 10, acquire_timeout: float = 10):
+        self.path = path
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self._conn = None
+        self._lock = threading.Lock()
+        self._holder = None
+
+    def _open(self) -> PooledConnection:
+        conn = sqlite3.connect(
+            self.path, timeout=self.timeout,
+            check_same_thread=False, factory=PooledConnection
+        )
+        conn.row_factory = sqlite3.Row
+        # SQLite по умолчанию не проверяет FOREIGN KEY — включаем явно
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        if not self._lock.acquire(timeout=self.acquire_timeout):
+            raise PoolTimeout("Соединение для записи занято")
+        try:
+            if self._conn is None:
+                self._conn = self._open()
+        except Exception:
+            self._lock.release()
+            raise
+        self._holder = threading.get_ident()
+        self._conn.owner = self
+        self._conn.in_use = True
+        return self._conn
+
+    def release(self, conn: PooledConnection):
+        if not conn.in_use:
+            return
+        conn.in_use = False
+        # незафиксированные изменения (ошибка в середине операции) откатываем
+        if conn.in_transaction:
+            conn.rollback()
+        self._holder = None
+        self._lock.release()
+
+    def release_if_held(self):
+        """Страховка на случай исключения между get_db() и close()."""
+        if self._holder == threading.get_ident() and self._conn is not None:
+            self._conn.close()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close_for_real()
+                self._conn = None
+
+
+# ============================================================
+# ЛОКАЛЬНАЯ РЕПЛИКА ДЛЯ ЧТЕНИЯ
+# ============================================================
+class ReplicaRefresher:
+    """
+    Периодически копирует основную базу в новый файл реплики через backup API
+    и переключает на него пул чтения. Чтения могут отставать от записи
+    на interval секунд.
+
+    Открытый файл нельзя заменить или удалить (Windows), поэтому каждое
+    обновление пишется под новым именем <replica>-<pid>-<n>, а старый файл
+    удаляется, когда пул закрывает последнее соединение с ним.
+
+    start() запускает поток обновления в текущем процессе; в процессе,
+    полученном через fork, его нужно вызвать заново.
+    """
+
+    def __init__(self, source: str, replica: str, pool: ReadPool, interval: float,
+                 log: logging.Logger = logger):
+        self.log = log
+        self.source = source
+        self.replica = replica
+        self.pool = pool
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._serial = itertools.count(1)
+        self._created = set()
+        pool.on_retire = self._remove
+
+    def refresh(self):
+        root, ext = os.path.splitext(self.replica)
+        path = f"{root}-{os.getpid()}-{next(self._serial)}{ext}"
+        src = sqlite3.connect(self.source, timeout=10)
+        dst = sqlite3.connect(path)
+        try:
+            src.backup(dst)
+            # копия наследует WAL основной базы; реплике он не нужен
+            dst.execute("PRAGMA journal_mode = DELETE")
+        except sqlite3.Error:
+            dst.close()
+            os.remove(path)
+            raise
+        finally:
+            dst.close()
+            src.close()
+        self._created.add(path)
+        self.pool.switch(path)
+
+    def _remove(self, path: str):
+        # удаляем только свои копии, но не файл, с которого пул начинал
+        if path not in self._created:
+            return
+        try:
+            os.remove(path)
+            self._created.discard(path)
+        except OSError as e:
+            self.log.error("Не удалось удалить старую реплику %s: %s", path, e)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # копии родительского процесса не наши: их читают другие воркеры
+            self._created = set()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        # первое обновление сразу; до него пул читает основную базу
+        while True:
+            try:
+                self.refresh()
+            except (sqlite3.Error, OSError) as e:
+                self.log.error("Ошибка обновления реплики: %s", e)
+            if self._stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        """Останавливает обновление; пул возвращается к основной базе."""
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        self.pool.switch(self.source)
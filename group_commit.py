@@ -0,0 +1,154 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from db_pool import Writer
+
+
+class GroupCommitQueue:
+    """
+    Отложенная запись: операции из разных запросов собираются в пачку
+    (до max_batch штук или max_delay_ms миллисекунд) и фиксируются одной
+    транзакцией в отдельном потоке. Future операции завершается только после
+    commit, то есть когда данные уже на диске.
+
+    Поток записи запускается при первом submit() в процессе: поток, созданный
+    до fork (например, в create_app под gunicorn --preload), в воркере не живёт.
+    """
+
+    def __init__(self, writer: Writer, max_batch: int = 100, max_delay_ms: float = 5):
+        self.writer = writer
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._commit_seconds_total = 0.0
+        self._last_commit_seconds = 0.0
+        self._lock_wait_seconds_total = 0.0
+        self._last_lock_wait_seconds = 0.0
+        self._max_batch_seen = 0
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # очередь родительского процесса обслуживать здесь некому
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, operation) -> Future:
+        """
+        operation(conn) выполняет запросы без commit. Исключение внутри
+        операции откатывает только её, остальные операции пачки сохраняются.
+        """
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((operation, future))
+        return future
+
+    def stop(self):
+        if self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._pid = None
+
+    def metrics(self) -> dict:
+        """
+        commit_ms — только conn.commit() пачки, lock_wait_ms — ожидание писателя
+        перед пачкой; время выполнения самих операций не входит ни в одно.
+        """
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": batches,
+                "items": self._items,
+                "max_batch": self._max_batch_seen,
+                "last_commit_ms": self._last_commit_seconds * 1000,
+                "avg_commit_ms": self._commit_seconds_total / batches * 1000 if batches else 0.0,
+                "last_lock_wait_ms": self._last_lock_wait_seconds * 1000,
+                "avg_lock_wait_ms": self._lock_wait_seconds_total / batches * 1000 if batches else 0.0
+            }
+
+    # -------------------------
+    # Поток записи
+    # -------------------------
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch: list):
+        results = []
+        conn = None
+        try:
+            started = time.perf_counter()
+            conn = self.writer.acquire()
+            lock_wait = time.perf_counter() - started
+            conn.execute("BEGIN")
+            for operation, future in batch:
+                # точка сохранения на каждую операцию: ошибка одной не отменяет пачку
+                conn.execute("SAVEPOINT item")
+                try:
+                    results.append((future, operation(conn), None))
+                    conn.execute("RELEASE item")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO item")
+                    conn.execute("RELEASE item")
+                    results.append((future, None, e))
+            started = time.perf_counter()
+            conn.commit()
+            commit_time = time.perf_counter() - started
+        except Exception as e:
+            # пачка не зафиксирована — сообщаем об ошибке всем её участникам;
+            # поток записи при этом продолжает работать
+            if conn is not None:
+                conn.close()
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        conn.close()
+
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._commit_seconds_total += commit_time
+            self._last_commit_seconds = commit_time
+            self._lock_wait_seconds_total += lock_wait
+            self._last_lock_wait_seconds = lock_wait
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,157 @@
+import unittest
+import sqlite3
+import tempfile
+import threading
+import shutil
+import json
+import time
+import os
+
+import backup
+from backup import backup_database, integrity_check, main, BackupInProgress
+
+
+class TestBackup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "clinic.db")
+        self.backup_dir = os.path.join(self.tmp_dir, "backups")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE patients (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany(
+            "INSERT INTO patients (name) VALUES (?)",
+            [(f"Пациент {i}",) for i in range(2000)]
+        )
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_backup_copies_data(self):
+        result = backup_database(self.db_path, self.backup_dir, step_sleep=0)
+
+        conn = sqlite3.connect(result["path"])
+        count = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        conn.close()
+
+        self.assertEqual(count, 2000)
+        self.assertEqual(integrity_check(result["path"]), "ok")
+
+    def test_backup_compressed(self):
+        result = backup_database(self.db_path, self.backup_dir, step_sleep=0, compress=True)
+
+        self.assertTrue(result["path"].endswith(".db.gz"))
+        self.assertEqual(integrity_check(result["path"]), "ok")
+
+    def test_rotation_keeps_latest(self):
+        paths = [
+            backup_database(self.db_path, self.backup_dir, step_sleep=0, keep=2)["path"]
+            for _ in range(4)
+        ]
+
+        self.assertEqual(sorted(os.listdir(self.backup_dir)),
+                         sorted(os.path.basename(p) for p in paths[-2:]))
+
+    def test_backup_while_source_is_written(self):
+        # база в несколько тысяч страниц: пошаговый backup API на такой
+        # базе под записью начинал копирование заново и не завершался
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executemany(
+            "INSERT INTO patients (name) VALUES (?)",
+            [("x" * 500,) for _ in range(20000)]
+        )
+        conn.commit()
+        conn.close()
+
+        stop = threading.Event()
+
+        def write():
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            while not stop.is_set():
+                conn.execute("INSERT INTO patients (name) VALUES ('Новый')")
+                conn.commit()
+                time.sleep(0.001)
+            conn.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            started = time.perf_counter()
+            result = backup_database(self.db_path, self.backup_dir, compress=True)
+            elapsed = time.perf_counter() - started
+        finally:
+            stop.set()
+            writer.join()
+
+        self.assertLess(elapsed, 5)
+        self.assertEqual(integrity_check(result["path"]), "ok")
+
+    def test_wal_copy_is_throttled(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        conn.close()
+
+        result = backup_database(self.db_path, self.backup_dir,
+                                 pages_per_step=1, step_sleep=0.01)
+
+        # пауза после каждого шага, кроме последнего
+        self.assertGreaterEqual(result["backup_seconds"], (pages - 1) * 0.01)
+        self.assertEqual(integrity_check(result["path"]), "ok")
+        self.assertFalse(os.path.exists(result["path"] + "-wal"))
+
+    def test_only_one_backup_at_a_time(self):
+        with backup._backup_lock:
+            self.assertTrue(backup.backup_running())
+            with self.assertRaises(BackupInProgress):
+                backup_database(self.db_path, self.backup_dir, step_sleep=0)
+        self.assertFalse(backup.backup_running())
+
+    def test_path_with_special_characters(self):
+        backup_dir = os.path.join(self.tmp_dir, "копии #1 ?50%")
+        result = backup_database(self.db_path, backup_dir, step_sleep=0)
+        self.assertEqual(integrity_check(result["path"]), "ok")
+
+    def test_backup_cli(self):
+        config_path = os.path.join(self.tmp_dir, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({"database": self.db_path, "BACKUP": {"DIR": self.backup_dir}}, f)
+
+        self.assertEqual(main(["--config", config_path, "--sleep", "0", "--compress"]), 0)
+
+        snapshots = os.listdir(self.backup_dir)
+        self.assertEqual(len(snapshots), 1)
+        self.assertTrue(snapshots[0].endswith(".db.gz"))
+
+    def test_backup_cli_resolves_paths_from_config_dir(self):
+        config_path = os.path.join(self.tmp_dir, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump({"database": "clinic.db", "BACKUP": {"DIR": "backups"}}, f)
+
+        cwd = os.getcwd()
+        os.chdir(tempfile.gettempdir())
+        try:
+            self.assertEqual(main(["--config", config_path, "--sleep", "0"]), 0)
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(len(os.listdir(self.backup_dir)), 1)
+
+    def test_missing_source_refused(self):
+        missing = os.path.join(self.tmp_dir, "missing.db")
+        with self.assertRaises(FileNotFoundError):
+            backup_database(missing, self.backup_dir, step_sleep=0)
+        self.assertFalse(os.path.exists(missing))
+        self.assertFalse(os.path.exists(self.backup_dir))
+
+    def test_verify_cli(self):
+        result = backup_database(self.db_path, self.backup_dir, step_sleep=0)
+        self.assertEqual(main(["--verify", result["path"]]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
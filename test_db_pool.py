@@ -0,0 +1,164 @@
+import unittest
+import sqlite3
+import tempfile
+import threading
+import shutil
+import os
+
+from db_pool import ReadPool, Writer, ReplicaRefresher, PoolTimeout
+
+
+class TestDbPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "clinic.db")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE patients (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.execute("INSERT INTO patients (name) VALUES ('Иван')")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_read_pool_is_read_only(self):
+        pool = ReadPool(self.db_path, size=1)
+        conn = pool.acquire()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0], 1)
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO patients (name) VALUES ('Пётр')")
+        conn.close()
+        pool.close_all()
+
+    def test_read_pool_reuses_connections(self):
+        pool = ReadPool(self.db_path, size=1)
+        first = pool.acquire()
+        first.close()
+        # повторный close() не должен закрыть соединение, уже вернувшееся в пул
+        first.close()
+        second = pool.acquire()
+        self.assertIs(first, second)
+        second.execute("SELECT 1").fetchone()
+        second.close()
+        pool.close_all()
+
+    def test_read_pool_acquire_timeout(self):
+        pool = ReadPool(self.db_path, size=1, acquire_timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        conn.close()
+        pool.close_all()
+
+    def test_release_with_stale_lease_is_ignored(self):
+        pool = ReadPool(self.db_path, size=1, acquire_timeout=0.05)
+        first = pool.acquire()
+        stale_lease = first.lease
+        first.close()
+
+        second = pool.acquire()
+        # запоздалая страховка первого владельца не должна отнять соединение
+        pool.release(second, stale_lease)
+        self.assertTrue(second.in_use)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        second.close()
+        pool.close_all()
+
+    def test_writer_rolls_back_and_releases(self):
+        writer = Writer(self.db_path)
+        conn = writer.acquire()
+        conn.execute("INSERT INTO patients (name) VALUES ('Пётр')")
+        # исключение до commit(): teardown вызывает release_if_held
+        writer.release_if_held()
+
+        conn = writer.acquire()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0], 1)
+        conn.close()
+        writer.close()
+
+    def test_writer_serializes_threads(self):
+        writer = Writer(self.db_path)
+        conn = writer.acquire()
+        acquired = threading.Event()
+
+        def other():
+            writer.acquire()
+            acquired.set()
+            writer.release_if_held()
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        conn.close()
+        thread.join()
+        self.assertTrue(acquired.is_set())
+        writer.close()
+
+    def test_writer_acquire_timeout(self):
+        writer = Writer(self.db_path, acquire_timeout=0.05)
+        conn = writer.acquire()
+        errors = []
+
+        def other():
+            try:
+                writer.acquire()
+            except PoolTimeout as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(errors), 1)
+        conn.close()
+        writer.close()
+
+    def test_replica_refresh_switches_pool(self):
+        replica_path = os.path.join(self.tmp_dir, "replica.db")
+        pool = ReadPool(self.db_path, size=2)
+        old = pool.acquire()
+
+        refresher = ReplicaRefresher(self.db_path, replica_path, pool, interval=60)
+        refresher.refresh()
+
+        conn = pool.acquire()
+        self.assertIsNot(conn, old)
+        self.assertNotEqual(pool.path, self.db_path)
+        self.assertTrue(pool.path.startswith(os.path.join(self.tmp_dir, "replica-")))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0], 1)
+        conn.close()
+        old.close()
+        # основная база не удаляется, хотя пул с неё переключился
+        self.assertTrue(os.path.exists(self.db_path))
+        pool.close_all()
+
+    def test_old_replica_removed_after_last_connection(self):
+        replica_path = os.path.join(self.tmp_dir, "replica.db")
+        pool = ReadPool(self.db_path, size=2)
+        refresher = ReplicaRefresher(self.db_path, replica_path, pool, interval=60)
+
+        refresher.refresh()
+        first = pool.path
+        reader = pool.acquire()
+
+        refresher.refresh()
+        second = pool.path
+        self.assertNotEqual(first, second)
+        # файл не заменялся и не удалялся, пока с него читают
+        self.assertTrue(os.path.exists(first))
+        self.assertEqual(reader.execute("SELECT COUNT(*) FROM patients").fetchone()[0], 1)
+
+        reader.close()
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+        refresher.stop()
+        self.assertEqual(pool.path, self.db_path)
+        self.assertFalse(os.path.exists(second))
+        self.assertTrue(os.path.exists(self.db_path))
+        pool.close_all()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import sqlite3
+import tempfile
+import shutil
+import time
+import os
+from unittest import mock
+
+from db_pool import Writer
+from group_commit import GroupCommitQueue
+
+
+class TestGroupCommit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "clinic.db")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE patients (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+        conn.commit()
+        conn.close()
+
+        self.writer = Writer(self.db_path)
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _count(self):
+        conn = sqlite3.connect(self.db_path)
+        count = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        conn.close()
+        return count
+
+    def test_items_grouped_into_one_commit(self):
+        write_queue = GroupCommitQueue(self.writer, max_batch=10, max_delay_ms=200)
+        futures = [
+            write_queue.submit(
+                lambda conn, i=i: conn.execute("INSERT INTO patients (name) VALUES (?)", (f"П{i}",)).lastrowid
+            )
+            for i in range(10)
+        ]
+
+        ids = [f.result(timeout=5) for f in futures]
+        write_queue.stop()
+
+        self.assertEqual(sorted(ids), list(range(1, 11)))
+        self.assertEqual(self._count(), 10)
+        metrics = write_queue.metrics()
+        self.assertEqual(metrics["items"], 10)
+        self.assertEqual(metrics["batches"], 1)
+        self.assertEqual(metrics["queue_depth"], 0)
+
+    def test_commit_time_excludes_lock_wait_and_operations(self):
+        write_queue = GroupCommitQueue(self.writer, max_batch=1, max_delay_ms=1)
+        held = self.writer.acquire()
+
+        def slow(conn):
+            time.sleep(0.1)
+            conn.execute("INSERT INTO patients (name) VALUES ('А')")
+
+        future = write_queue.submit(slow)
+        time.sleep(0.1)
+        held.close()
+        future.result(timeout=5)
+        write_queue.stop()
+
+        metrics = write_queue.metrics()
+        self.assertGreaterEqual(metrics["last_lock_wait_ms"], 50)
+        self.assertLess(metrics["last_commit_ms"], 50)
+
+    def test_failed_item_does_not_sink_batch(self):
+        write_queue = GroupCommitQueue(self.writer, max_batch=3, max_delay_ms=200)
+
+        def bad(conn):
+            conn.execute("INSERT INTO patients (name) VALUES ('Плохой')")
+            raise ValueError("Некорректные данные")
+
+        ok_first = write_queue.submit(lambda conn: conn.execute("INSERT INTO patients (name) VALUES ('А')"))
+        failed = write_queue.submit(bad)
+        ok_last = write_queue.submit(lambda conn: conn.execute("INSERT INTO patients (name) VALUES ('Б')"))
+
+        ok_first.result(timeout=5)
+        ok_last.result(timeout=5)
+        with self.assertRaises(ValueError):
+            failed.result(timeout=5)
+        write_queue.stop()
+
+        self.assertEqual(self._count(), 2)
+
+    def test_writer_error_fails_batch_but_keeps_thread(self):
+        writer = self.writer
+        original_acquire = writer.acquire
+        calls = []
+
+        def flaky_acquire():
+            calls.append(1)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("disk I/O error")
+            return original_acquire()
+
+        writer.acquire = flaky_acquire
+        write_queue = GroupCommitQueue(writer, max_batch=1, max_delay_ms=1)
+        insert = lambda conn: conn.execute("INSERT INTO patients (name) VALUES ('А')")
+
+        with self.assertRaises(sqlite3.OperationalError):
+            write_queue.submit(insert).result(timeout=5)
+        write_queue.submit(insert).result(timeout=5)
+        write_queue.stop()
+
+        self.assertEqual(self._count(), 1)
+
+
+    def test_thread_started_on_first_submit_and_after_fork(self):
+        write_queue = GroupCommitQueue(self.writer, max_batch=1, max_delay_ms=1)
+        self.assertIsNone(write_queue._thread)
+
+        insert = lambda conn: conn.execute("INSERT INTO patients (name) VALUES ('А')")
+        write_queue.submit(insert).result(timeout=5)
+        parent_thread = write_queue._thread
+
+        # в дочернем процессе поток родителя не существует — нужен свой
+        with mock.patch("group_commit.os.getpid", return_value=os.getpid() + 1):
+            write_queue.submit(insert).result(timeout=5)
+            self.assertIsNot(write_queue._thread, parent_thread)
+            write_queue.stop()
+
+        self.assertEqual(self._count(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()